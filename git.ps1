@@ -10,6 +10,15 @@ $BaseDir = "$env:USERPROFILE\.git-switch"
 $ProfilesFile = "$BaseDir\profiles.json"
 $SSHDir = "$env:USERPROFILE\.ssh"
 $SSHConfigFile = "$SSHDir\config"
+$KnownHostsFile = "$SSHDir\known_hosts"
+$GitHubSSHKeysUrl = "https://github.com/settings/ssh/new"
+
+# Regex validate compile san 1 lan o script scope (dung trong retry loop nhap lieu)
+$AliasRegex = [regex]'^[a-zA-Z0-9]+$'
+$EmailRegex = [regex]'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+# 2 pattern remote URL: ssh (co hoac khong co -profile suffix) va https -> 1 lan match ra repo path
+$SSHUrlRegex   = [regex]'^git@github\.com(?:-[^:]+)?:(?<repo>.+)$'
+$HTTPSUrlRegex = [regex]'^https://github\.com/(?<repo>.+)$'
 
 
 # -------------------------- HELPER: UI & BOX DRAWING --------------------------
@@ -21,14 +30,23 @@ function Write-Color {
 }
 
 # Đổi sang nét đơn (┌ ─ ┐) giống JDK-Switch để không bị lỗi ?????
+# Build san duong ke ngang cho width mac dinh (60) - khoi nhan chuoi lai moi lan ve khung
+$script:BoxH60 = "─" * 60
+
+function Get-Box-H {
+    param([int]$Width)
+    if ($Width -eq 60) { return $script:BoxH60 }
+    return "─" * $Width
+}
+
 function Draw-Border-Top {
     param([int]$Width = 60, [ConsoleColor]$Color = "Cyan")
-    Write-Color ("┌" + ("─" * $Width) + "┐") -Color $Color
+    Write-Color ("┌" + (Get-Box-H $Width) + "┐") -Color $Color
 }
 
 function Draw-Border-Bottom {
     param([int]$Width = 60, [ConsoleColor]$Color = "Cyan")
-    Write-Color ("└" + ("─" * $Width) + "┘") -Color $Color
+    Write-Color ("└" + (Get-Box-H $Width) + "┘") -Color $Color
 }
 
 function Draw-Line {
@@ -37,14 +55,43 @@ function Draw-Line {
     $PadRight = $Width - $Content.Length
     if ($PadRight -lt 0) { $PadRight = 0 }
     Write-Color "│" -Color $Color -NoNewLine
-    Write-Color $Content -Color $TextColor -NoNewLine
-    Write-Color (" " * $PadRight) -NoNewLine
+    # Gop content + padding lam 1 lan write (padding la space, mau chu khong anh huong)
+    Write-Color ($Content + (" " * $PadRight)) -Color $TextColor -NoNewLine
     Write-Color "│" -Color $Color
 }
 
 function Draw-Separator {
     param([int]$Width = 60, [ConsoleColor]$Color = "Cyan")
-    Write-Color ("├" + ("─" * $Width) + "┤") -Color $Color
+    Write-Color ("├" + (Get-Box-H $Width) + "┤") -Color $Color
+}
+
+function Read-Input {
+    param([string]$Prompt)
+    # Stdin bi redirect (test script / provisioning pipeline dieu khien) -> doc thang tu stdin;
+    # Read-Host cua console host khong tin cay duoc khi khong co terminal that
+    if ([Console]::IsInputRedirected) {
+        Write-Host "${Prompt}: " -NoNewline
+        $Line = [Console]::In.ReadLine()
+        # EOF (het input script) -> ReadLine tra $null; map sang "0" (= cancel/exit o moi prompt)
+        # de menu loop va cac retry loop thoat ra thay vi spin vo han voi key null
+        if ($null -eq $Line) { return "0" }
+        return $Line
+    }
+    return Read-Host $Prompt
+}
+
+# Detect VT 1 lan luc load (Windows 10+/Windows Terminal deu ho tro)
+$script:SupportsVT = $false
+try { $script:SupportsVT = $Host.UI.SupportsVirtualTerminal } catch { }
+
+function Clear-Screen {
+    # Console ho tro VT -> ghi thang escape sequence (1 write duy nhat),
+    # khoi di qua cac console API call cua Clear-Host
+    if ($script:SupportsVT) {
+        [Console]::Write("$([char]27)[2J$([char]27)[H")
+    } else {
+        Clear-Host
+    }
 }
 
 function Draw-Sep {
@@ -60,8 +107,26 @@ function Draw-Header {
 
 # -------------------------- CORE LOGIC (PORTED FROM PYTHON) --------------------------
 
+# Memoized tool lookup. Get-Command quet PATH + PATHEXT kha nang cham tren Windows,
+# nen chi quet 1 lan cho moi tool roi cache lai cho ca session.
+$script:ToolPathCache = @{}
+
+function Find-Tool {
+    param([string]$Name)
+    if (-not $script:ToolPathCache.ContainsKey($Name)) {
+        $Cmd = Get-Command $Name -CommandType Application -ErrorAction SilentlyContinue | Select-Object -First 1
+        $script:ToolPathCache[$Name] = if ($Cmd) { $Cmd.Source } else { $null }
+    }
+    return $script:ToolPathCache[$Name]
+}
+
+$script:SystemInitialized = $false
 
 function Initialize-System {
+    # Load-Profiles goi ham nay moi lan -> 4 lan Test-Path lap lai vo ich.
+    # Thu muc/file da tao thi ton tai suot session, check 1 lan la du.
+    if ($script:SystemInitialized) { return }
+
     # Logic tạo file config an toàn kiểu JDK-Switch
     if (-not (Test-Path $BaseDir)) { New-Item -ItemType Directory -Path $BaseDir -Force | Out-Null }
     
@@ -72,17 +137,28 @@ function Initialize-System {
 
     if (-not (Test-Path $SSHDir)) { New-Item -ItemType Directory -Path $SSHDir -Force | Out-Null }
     if (-not (Test-Path $SSHConfigFile)) { New-Item -ItemType File -Path $SSHConfigFile -Force | Out-Null }
+
+    $script:SystemInitialized = $true
 }
 
+# Cache profiles trong RAM, key theo LastWriteTime -> khong phai doc + parse JSON lai moi lan goi
+$script:ProfilesCache = $null   # @{ Ticks = [long]; Data = [array] }
+
 function Load-Profiles {
     Initialize-System
     try {
-        $Content = Get-Content $ProfilesFile -Raw -Encoding UTF8 -ErrorAction Stop
+        $Ticks = (Get-Item $ProfilesFile -ErrorAction Stop).LastWriteTimeUtc.Ticks
+        if ($script:ProfilesCache -and $script:ProfilesCache.Ticks -eq $Ticks) {
+            return $script:ProfilesCache.Data
+        }
+        # ReadAllText: 1 call .NET doc tron file nho, nhe hon pipeline Get-Content
+        $Content = [IO.File]::ReadAllText($ProfilesFile)
         if ([string]::IsNullOrWhiteSpace($Content)) { return @() }
         $Data = $Content | ConvertFrom-Json
-        if ($Data -is [System.Array]) { return $Data }
-        if ($null -eq $Data) { return @() }
-        return @($Data)
+        if ($null -eq $Data) { $Data = @() }
+        if ($Data -isnot [System.Array]) { $Data = @($Data) }
+        $script:ProfilesCache = @{ Ticks = $Ticks; Data = $Data }
+        return $Data
     } catch {
         return @()
     }
@@ -90,40 +166,112 @@ function Load-Profiles {
 
 function Save-Profiles($Data) {
     if ($Data -isnot [System.Array]) { $Data = @($Data) }
-    $Data | ConvertTo-Json -Depth 5 | Set-Content $ProfilesFile -Encoding UTF8
+    # Ghi ra file tam roi Move-Item de thay the -> crash giua chung khong de lai profiles.json hong
+    $Tmp = "$ProfilesFile.tmp"
+    $Data | ConvertTo-Json -Depth 5 | Set-Content $Tmp -Encoding UTF8
+    Move-Item -Path $Tmp -Destination $ProfilesFile -Force
+    # Update cache ngay sau khi ghi de khoi phai reload
+    $script:ProfilesCache = @{ Ticks = (Get-Item $ProfilesFile).LastWriteTimeUtc.Ticks; Data = $Data }
 }
 
+# Cache git config global cho ca session - banner redraw khong phai fork git lien tuc.
+# Moi duong ghi config trong app nay deu invalidate/cap nhat cache.
+$script:GitConfigCache = $null
+
 function Get-Git-Current {
+    if ($script:GitConfigCache) { return $script:GitConfigCache }
     try {
-        $Name = git config --global user.name
-        $Email = git config --global user.email
+        # 1 lan 'git config --list' thay vi fork git 2 lan cho name + email
+        $Map = @{}
+        foreach ($Line in @(git config --global --list 2>$null)) {
+            $Eq = "$Line".IndexOf('=')
+            if ($Eq -gt 0) { $Map["$Line".Substring(0, $Eq)] = "$Line".Substring($Eq + 1) }
+        }
+        $Name = $Map['user.name']
+        $Email = $Map['user.email']
         if (-not $Name) { $Name = "Not Set" }
         if (-not $Email) { $Email = "Not Set" }
-        return @{ Name = $Name; Email = $Email }
+        # Giu nguyen Map day du - cac buoc cleanup dung de xem [user] con key nao khac
+        $script:GitConfigCache = @{ Name = $Name; Email = $Email; Map = $Map }
+        return $script:GitConfigCache
     } catch {
+        # Git thieu/loi -> khong cache, lan sau thu lai
         return @{ Name = "Git Not Found"; Email = "Check Install" }
     }
 }
 
+# Probe Set-Clipboard dung 1 lan cho ca session (host cu/Server Core co the thieu cmdlet)
+$script:HasClipboard = $null
+
+function Copy-To-Clipboard {
+    param([string]$Text)
+    if ($null -eq $script:HasClipboard) {
+        $script:HasClipboard = [bool](Get-Command Set-Clipboard -ErrorAction SilentlyContinue)
+    }
+    if (-not $script:HasClipboard) { return $false }
+    try {
+        Set-Clipboard -Value $Text
+        return $true
+    } catch {
+        # Cmdlet co nhung runtime loi (vd: khong co desktop session) -> nho lai, khong thu nua
+        $script:HasClipboard = $false
+        return $false
+    }
+}
+
+function Set-Git-Identity {
+    param($Name, $Email)
+    # Config dang active da dung gia tri nay roi -> no-op, khoi fork git 2 lan
+    # (chi tin cache trong session; cache trong thi ghi binh thuong cho chac)
+    $Curr = $script:GitConfigCache
+    if ($Curr -and $Curr.Name -eq $Name -and $Curr.Email -eq $Email) { return }
+
+    # git CLI khong set duoc 2 key trong 1 process, nhung gom ve 1 helper
+    # de moi duong ghi config di qua 1 cho duy nhat
+    git config --global user.name "$Name"
+    git config --global user.email "$Email"
+    # Gia tri moi da biet -> cap nhat cache luon, khoi can doc lai
+    $script:GitConfigCache = @{ Name = $Name; Email = $Email }
+}
+
 # --- SSH LOGIC ---
 
 function Generate-SSH-Key {
-    param($Email, $Alias)
-    
-    $KeyPath = "$SSHDir\id_rsa_$Alias"
-    
+    # Ed25519 mac dinh: gen nhanh hon RSA-4096 nhieu lan, handshake cung nhe hon.
+    # GitHub ho tro day du; chi can rsa thi truyen -KeyType rsa.
+    param($Email, $Alias, $KeyType = "ed25519")
+
+    $KeyPath = "$SSHDir\id_${KeyType}_$Alias"
+
     if (Test-Path $KeyPath) {
         Write-Color "  [!] SSH Key already exists for this alias. Using existing key." -Color Yellow
         return $KeyPath
     }
 
-    Write-Color "  [INFO] Generating new SSH Key..." -Color Cyan
-    
+    # Profile cu tao bang RSA -> tiep tuc dung key cu, khong gen lai
+    $LegacyPath = "$SSHDir\id_rsa_$Alias"
+    if ($KeyType -ne "rsa" -and (Test-Path $LegacyPath)) {
+        Write-Color "  [!] Found existing RSA key for this alias. Using existing key." -Color Yellow
+        return $LegacyPath
+    }
+
+    if (-not (Find-Tool "ssh-keygen")) {
+        Write-Color "  [X] ssh-keygen not found. Ensure OpenSSH is installed." -Color Red
+        return $null
+    }
+
+    Write-Color "  [INFO] Generating new SSH Key ($KeyType)..." -Color Cyan
+
     # Gọi ssh-keygen, passphase rỗng (-N "") để tự động hóa
     try {
         # FIX: Dùng '""' (bao quanh bởi nháy đơn) để PowerShell truyền đúng chuỗi rỗng cho ssh-keygen
-        & ssh-keygen -t rsa -b 4096 -C "$Email" -f "$KeyPath" -N '""' | Out-Null
-        
+        # Gan vao $null thay vi pipe Out-Null -> khoi dung pipeline cho output bo di
+        if ($KeyType -eq "rsa") {
+            $null = & ssh-keygen -t rsa -b 4096 -C "$Email" -f "$KeyPath" -N '""'
+        } else {
+            $null = & ssh-keygen -t ed25519 -C "$Email" -f "$KeyPath" -N '""'
+        }
+
         if ($LASTEXITCODE -eq 0) {
             Write-Color "  [✔] SSH Key generated successfully." -Color Green
             return $KeyPath
@@ -138,7 +286,16 @@ function Generate-SSH-Key {
 
 function Update-SSH-Config {
     param($Alias, $KeyPath)
-    
+
+    # Da co block cho alias nay roi -> khong append nua.
+    # Truoc day moi lan add la append mu -> config phinh dan, ssh parse cham hon moi lan chay.
+    # Pattern anchor ca dong: 'Host github.com-Work2' khong duoc lam skip alias 'Work'
+    if ((Test-Path $SSHConfigFile) -and
+        (Select-String -Path $SSHConfigFile -Pattern "^\s*Host github\.com-$([regex]::Escape($Alias))\s*$" -Quiet)) {
+        Write-Color "  [INFO] SSH Config already has Host github.com-$Alias. Skipping." -Color Gray
+        return
+    }
+
     # Định dạng block config giống logic Python
     # Host ảo sẽ là: github.com-<alias>
     $ConfigBlock = @"
@@ -159,53 +316,130 @@ Host github.com-$Alias
     }
 }
 
+# Regex xoa block cua tung alias - compile 1 lan roi cache, lan xoa sau khoi compile lai
+$script:SSHBlockRegexCache = @{}
+
+function Get-SSHBlock-Regex {
+    param($Alias)
+    if (-not $script:SSHBlockRegexCache.ContainsKey($Alias)) {
+        # Block = tu dong '# Git profile: <alias>' (nguyen dong, \b chan alias-prefix kieu Work/Work2)
+        # an het cho toi dong trong ke tiep (nuot luon dong trong do) hoac het file
+        $Pattern = "(?ms)^[ \t]*# Git profile: " + [regex]::Escape($Alias) + "\b[^\r\n]*\r?\n.*?(?:\r?\n[ \t]*\r?\n|\z)"
+        $script:SSHBlockRegexCache[$Alias] = [regex]$Pattern
+    }
+    return $script:SSHBlockRegexCache[$Alias]
+}
+
 function Remove-From-SSH-Config {
     param($Alias)
-    
+
     if (-not (Test-Path $SSHConfigFile)) { return }
-    
+
     try {
-        # Đọc toàn bộ dòng
-        $Lines = Get-Content $SSHConfigFile -Encoding UTF8
-        $NewLines = @()
-        $Skip = $false
-        
-        foreach ($Line in $Lines) {
-            # Tìm dòng bắt đầu comment profile
-            if ($Line -match "# Git profile: $Alias") {
-                $Skip = $true
-                continue
-            }
-            
-            # Nếu đang skip mà gặp dòng trống (hết block) hoặc block mới -> dừng skip
-            if ($Skip -and ($Line.Trim() -eq "" -or $Line -match "^Host ")) {
-                 # Nếu gặp Host khác ngay lập tức thì giữ lại, nếu dòng trống thì bỏ qua 1 dòng trống
-                 if ($Line -match "^Host ") { $Skip = $false }
-            }
-            
-            # Logic đơn giản hóa: Block kết thúc bằng dòng trống hoặc Host tiếp theo
-            # Logic Python: Remove lines until next empty line or next header
-            if ($Skip) {
-                if ([string]::IsNullOrWhiteSpace($Line)) { $Skip = $false }
-            } else {
-                $NewLines += $Line
-            }
+        # 1 lan doc + 1 lan regex sub tren toan van ban thay vi state machine duyet tung dong
+        # (Logic Python goc: remove lines until next empty line or next header)
+        $Text = [IO.File]::ReadAllText($SSHConfigFile)
+        $NewText = (Get-SSHBlock-Regex $Alias).Replace($Text, "")
+
+        # Khong co gi thay doi -> khoi dung den disk
+        if ($NewText -eq $Text) {
+            Write-Color "  [INFO] No SSH Config entry found for '$Alias'." -Color Gray
+            return
         }
-        
-        $NewLines | Set-Content $SSHConfigFile -Encoding UTF8
+
+        # Ghi ra file tam roi thay the - crash giua chung khong de lai config ghi do
+        $Tmp = "$SSHConfigFile.tmp"
+        [IO.File]::WriteAllText($Tmp, $NewText)
+        Move-Item -Path $Tmp -Destination $SSHConfigFile -Force
         Write-Color "  [✔] Removed entry from SSH Config." -Color Green
     } catch {
         Write-Color "  [!] Error cleaning SSH Config." -Color Yellow
     }
 }
 
+# known_hosts chi duoc them vao, khong bi xoa trong app nay -> ket qua "da biet host"
+# dung cho ca session, cache lai de cac lan test sau khoi quet file
+$script:GitHubHostKnown = $false
+
+function Test-GitHub-KnownHost {
+    if ($script:GitHubHostKnown) { return $true }
+    # Select-String -Quiet doc theo dong va dung ngay khi match
+    # -> khong can load + decode ca known_hosts (file co the rat dai) vao RAM
+    if (-not (Test-Path $KnownHostsFile)) { return $false }
+    if (Select-String -Path $KnownHostsFile -Pattern "github.com" -SimpleMatch -Quiet) {
+        $script:GitHubHostKnown = $true
+        return $true
+    }
+    return $false
+}
+
+function Add-GitHub-HostKey {
+    if (-not (Find-Tool "ssh-keyscan")) { return }
+    Write-Color "   [INFO] Adding github.com host keys to known_hosts..." -Color Cyan
+    try {
+        # File co san ma dong cuoi thieu newline -> dong keyscan dau tien se dinh vao
+        # entry cuoi cua user, hong ca 2. Doc dung 1 byte cuoi de kiem tra truoc khi append.
+        if (Test-Path $KnownHostsFile) {
+            $NeedsNewline = $false
+            $Fs = [IO.File]::Open($KnownHostsFile, 'Open', 'Read')
+            try {
+                if ($Fs.Length -gt 0) {
+                    $null = $Fs.Seek(-1, 'End')
+                    $NeedsNewline = ($Fs.ReadByte() -ne 10)
+                }
+            } finally { $Fs.Close() }
+            if ($NeedsNewline) { Add-Content -Path $KnownHostsFile -Value "" -Encoding UTF8 }
+        }
+
+        # Output ssh-keyscan stream thang vao known_hosts tung dong, khong buffer ca cuc;
+        # lay ca 3 loai key trong 1 lan goi de sau nay GitHub doi key type khong phai scan lai
+        & ssh-keyscan -t rsa,ecdsa,ed25519 github.com 2>$null | Add-Content -Path $KnownHostsFile -Encoding UTF8
+        if ($LASTEXITCODE -eq 0) { $script:GitHubHostKnown = $true }
+    } catch {
+        Write-Color "   [!] Could not fetch GitHub host keys (offline?)." -Color Yellow
+    }
+}
+
+function Find-GitDir {
+    # Di nguoc cay thu muc tim .git thay vi fork 'git rev-parse' (~20-50ms/lan tren Windows).
+    # .git co the la file (worktree/submodule) nen chi can Test-Path, khong phan biet dir/file.
+    $P = (Get-Location).Path
+    for ($i = 0; $i -lt 40 -and $P; $i++) {
+        $G = Join-Path $P ".git"
+        if (Test-Path $G) { return $G }
+        $Parent = Split-Path $P -Parent
+        if (-not $Parent -or $Parent -eq $P) { break }
+        $P = $Parent
+    }
+    return $null
+}
+
+function Test-InGitRepo {
+    return [bool](Find-GitDir)
+}
+
+function Get-Origin-Url {
+    # Layout thuong gap: url nam ngay trong [remote "origin"] cua .git/config
+    # -> doc file truc tiep, khoi fork 'git remote get-url'
+    $G = Find-GitDir
+    if ($G -and (Test-Path $G -PathType Container)) {
+        $Cfg = Join-Path $G "config"
+        if (Test-Path $Cfg) {
+            $Text = [IO.File]::ReadAllText($Cfg)
+            $M = [regex]::Match($Text, '(?ms)^\[remote "origin"\][^\[]*?^\s*url\s*=\s*(\S+)')
+            if ($M.Success) { return $M.Groups[1].Value }
+        }
+    }
+    # .git la file (worktree/submodule) hoac config la/khong match -> de git tu xu ly
+    return git remote get-url origin 2>$null
+}
+
 function Update-Repo-Url {
     param($Alias)
     # Kiểm tra xem đang ở trong repo git không
-    $IsGit = git rev-parse --is-inside-work-tree 2>$null
-    if (-not $IsGit) { return }
+    if (-not (Test-InGitRepo)) { return }
 
-    $CurrentUrl = git remote get-url origin 2>$null
+    $CurrentUrl = Get-Origin-Url
     if (-not $CurrentUrl) { return }
 
     Write-Color "`n  [INFO] Checking Repository URL..." -Color Cyan
@@ -213,22 +447,15 @@ function Update-Repo-Url {
     # Logic chuyển đổi URL (Python logic ported)
     # Convert: https://github.com/user/repo -> git@github.com-Alias:user/repo
     # Convert: git@github.com:user/repo     -> git@github.com-Alias:user/repo
-    
+    # (pattern ssh bao luon truong hop da gan profile khac: git@github.com-X:user/repo)
+
     $NewHost = "github.com-$Alias"
     $NewUrl = $null
 
-    if ($CurrentUrl -match "https://github.com/(.*)") {
-        $RepoPart = $Matches[1]
-        $NewUrl = "git@$NewHost`:$RepoPart"
-    }
-    elseif ($CurrentUrl -match "git@github.com:(.*)") {
-        $RepoPart = $Matches[1]
-        $NewUrl = "git@$NewHost`:$RepoPart"
-    }
-    elseif ($CurrentUrl -match "git@github.com-.*:(.*)") {
-        # Đã dùng profile khác, switch sang profile này
-        $RepoPart = $Matches[1]
-        $NewUrl = "git@$NewHost`:$RepoPart"
+    $M = $SSHUrlRegex.Match($CurrentUrl)
+    if (-not $M.Success) { $M = $HTTPSUrlRegex.Match($CurrentUrl) }
+    if ($M.Success) {
+        $NewUrl = "git@$NewHost`:$($M.Groups['repo'].Value)"
     }
 
     if ($NewUrl -and $NewUrl -ne $CurrentUrl) {
@@ -253,10 +480,32 @@ function Test-Connection-Action {
         $Text = "  [$($i+1)] $($Profiles[$i].alias)"
         Draw-Line $Text 60 "Magenta" "White"
     }
+    Draw-Line "  [A] Test ALL profiles (parallel)" 60 "Magenta" "Gray"
     Draw-Border-Bottom 60 "Magenta"
 
-    $Choice = Read-Host "  Select ID to test (0 to cancel)"
-    if ($Choice -eq "0" -or -not ($Choice -as [int])) { return }
+    $Choice = Read-Input "  Select ID to test, A for all (0 to cancel)"
+    if ($Choice -eq "0") { return }
+
+    if ($Choice -eq "A" -or $Choice -eq "a") {
+        $Targets = @($Profiles | Where-Object { $_.keyPath })
+        if ($Targets.Count -eq 0) { Write-Color "  [!] No profiles with SSH keys to test." "Yellow"; return }
+
+        # Dam bao host key co san truoc khi ban ra N job ssh cung luc
+        if (-not (Test-GitHub-KnownHost)) { Add-GitHub-HostKey }
+
+        Write-Color "`n   [INFO] Testing $($Targets.Count) profile(s) in parallel..." -Color Cyan
+        $Results = Test-All-Profiles $Targets
+        foreach ($R in $Results) {
+            if ($R.Success) { Write-Color "   [✔] $($R.Alias): Authenticated" -Color Green }
+            else            { Write-Color "   [X] $($R.Alias): FAILED" -Color Red }
+        }
+        if ($Results.Count -lt $Targets.Count) {
+            Write-Color "   [!] $($Targets.Count - $Results.Count) test(s) timed out." -Color Yellow
+        }
+        return
+    }
+
+    if (-not ($Choice -as [int])) { return }
     $Idx = [int]$Choice - 1
     if ($Idx -lt 0 -or $Idx -ge $Profiles.Count) { return }
 
@@ -274,7 +523,12 @@ function Test-GitHub-Connection {
     param($Alias)
     $HostAlias = "github.com-$Alias"
     Write-Color "`n   [INFO] Testing connection to $HostAlias..." -Color Cyan
-    
+
+    if (-not (Test-GitHub-KnownHost)) {
+        # Them host key truoc de 'ssh -T' khong dung lai o prompt xac nhan host
+        Add-GitHub-HostKey
+    }
+
     $OutputStr = ""
     try {
         # FIX: Thêm pipe | ForEach-Object { "$_" }
@@ -298,35 +552,61 @@ function Test-GitHub-Connection {
     }
 }
 
+function Test-All-Profiles {
+    param($Profiles)
+    # Cac probe 'ssh -T' doc lap nhau va chu yeu ngoi cho mang -> chay song song bang job,
+    # tong thoi gian ~ max(RTT cua 1 profile) thay vi cong don tung profile
+    $Jobs = @()
+    foreach ($P in $Profiles) {
+        $Jobs += Start-Job -ArgumentList $P.alias -ScriptBlock {
+            param($Alias)
+            $Output = & ssh -o BatchMode=yes -T "git@github.com-$Alias" 2>&1 | ForEach-Object { "$_" }
+            [PSCustomObject]@{
+                Alias   = $Alias
+                Success = (($Output | Out-String) -match "successfully authenticated")
+            }
+        }
+    }
+
+    $Results = @($Jobs | Wait-Job -Timeout 30 | Receive-Job)
+    $Jobs | Remove-Job -Force
+    return $Results
+}
+
 function Add-Profile-Action {
     Write-Host "`n"
     Draw-Header "ADD NEW GIT PROFILE"
     
     $Alias = $null
-    
+
+    # Load 1 lan truoc vong lap - khong reload lai sau moi lan go sai
+    $Profiles = @(Load-Profiles)
+
+    # Index alias 1 lan -> check trung O(1) moi lan retry, khong quet Where-Object lai
+    # (hashtable PowerShell mac dinh case-insensitive, khop voi -eq cu)
+    $AliasIndex = @{}
+    foreach ($P in $Profiles) { $AliasIndex[$P.alias] = $true }
+
     # --- VÒNG LẶP NHẬP ALIAS (RETRY LOOP) ---
     while ($true) {
-        $Alias = Read-Host "   Enter Profile Alias (e.g. Work, Personal)"
+        $Alias = Read-Input "   Enter Profile Alias (e.g. Work, Personal)"
         if ($Alias -eq "0") { return }
 
         $ErrorMsg = $null
-        
+
         if ([string]::IsNullOrWhiteSpace($Alias)) {
             $ErrorMsg = "Alias required."
         }
-        elseif ($Alias -notmatch "^[a-zA-Z0-9]+$") {
+        elseif (-not $AliasRegex.IsMatch($Alias)) {
             $ErrorMsg = "Alias must be alphanumeric (no spaces/symbols)."
         }
-        else {
-            $Profiles = @(Load-Profiles)
-            if ($Profiles | Where-Object { $_.alias -eq $Alias }) {
-                $ErrorMsg = "Profile '$Alias' already exists."
-            }
+        elseif ($AliasIndex.ContainsKey($Alias)) {
+            $ErrorMsg = "Profile '$Alias' already exists."
         }
 
         if ($ErrorMsg) {
             Write-Color "   [!] $ErrorMsg" "Red"
-            $Retry = Read-Host "   Press ENTER to retry, or type '0' to back"
+            $Retry = Read-Input "   Press ENTER to retry, or type '0' to back"
             if ($Retry -eq "0") { return }
             Write-Host ""
         } else {
@@ -335,11 +615,15 @@ function Add-Profile-Action {
     }
     # ---------------------------------------
 
-    $UName = Read-Host "   Enter Git User Name (e.g. John Doe)"
-    $UEmail = Read-Host "   Enter Git Email     (e.g. john@company.com)"
+    $UName = Read-Input "   Enter Git User Name (e.g. John Doe)"
+    $UEmail = Read-Input "   Enter Git Email     (e.g. john@company.com)"
+
+    if ([string]::IsNullOrWhiteSpace($UName) -or [string]::IsNullOrWhiteSpace($UEmail)) {
+        Write-Color "   [!] Name and Email are required." "Red"; return
+    }
 
-    if ([string]::IsNullOrWhiteSpace($UName) -or [string]::IsNullOrWhiteSpace($UEmail)) { 
-        Write-Color "   [!] Name and Email are required." "Red"; return 
+    if (-not $EmailRegex.IsMatch($UEmail)) {
+        Write-Color "   [!] Invalid email format (e.g. john@company.com)." "Red"; return
     }
 
     # 1. Generate Key
@@ -352,11 +636,10 @@ function Add-Profile-Action {
     # 3. Clipboard
     $PubKeyPath = "$KeyPath.pub"
     if (Test-Path $PubKeyPath) {
-        $PubKeyContent = Get-Content $PubKeyPath -Raw
-        try {
-            Set-Clipboard -Value $PubKeyContent
+        $PubKeyContent = [IO.File]::ReadAllText($PubKeyPath)
+        if (Copy-To-Clipboard $PubKeyContent) {
             Write-Color "   [✔] Public Key copied to CLIPBOARD!" -Color Green
-        } catch {
+        } else {
             Write-Color "   [!] Could not auto-copy. Please open .pub file manually." -Color Yellow
         }
     }
@@ -369,9 +652,11 @@ function Add-Profile-Action {
     Write-Host "   4. Come back here and press ENTER." -ForegroundColor Gray
     
     Start-Sleep -Seconds 2
-    Start-Process "https://github.com/settings/ssh/new"
+    # Start-Process voi URL = ShellExecute truc tiep (tuong duong os.startfile),
+    # khong can fallback chain do browser nhu ban Python
+    Start-Process $GitHubSSHKeysUrl
     
-    Read-Host "`n   Press ENTER after you have added the key on GitHub..."
+    Read-Input "`n   Press ENTER after you have added the key on GitHub..."
 
     # 5. Test Connection
     $null = Test-GitHub-Connection -Alias $Alias
@@ -393,8 +678,7 @@ function Add-Profile-Action {
     # ==========================================================================
     $Curr = Get-Git-Current
     if ($Curr.Name -eq "Not Set" -or $Curr.Name -eq $null) {
-        git config --global user.name "$UName"
-        git config --global user.email "$UEmail"
+        Set-Git-Identity -Name $UName -Email $UEmail
         Write-Color "   [INFO] Auto-set as Global Git Config (was previously unset)." -Color Cyan
     }
 }
@@ -409,14 +693,15 @@ function Switch-Profile-Action {
     # Header cột (Màu tối để làm nền)
     $Format = "     [{0}] {1,-15} {2}"
     Write-Host ($Format -f "#", "ALIAS", "EMAIL") -ForegroundColor DarkGray
-    
-    # Danh sách Profile
-    for ($i = 0; $i -lt $Profiles.Count; $i++) {
-        Write-Host ($Format -f ($i+1), $Profiles[$i].alias, $Profiles[$i].userEmail) -ForegroundColor White
+
+    # Danh sách Profile - gop N dong thanh 1 lan Write-Host
+    $Rows = for ($i = 0; $i -lt $Profiles.Count; $i++) {
+        $Format -f ($i + 1), $Profiles[$i].alias, $Profiles[$i].userEmail
     }
+    Write-Host ($Rows -join "`n") -ForegroundColor White
     Draw-Sep
 
-    $Choice = Read-Host "   Choose ID (0 to cancel)"
+    $Choice = Read-Input "   Choose ID (0 to cancel)"
     
     # Validate Input
     if ($Choice -eq "0" -or -not ($Choice -as [int])) { return }
@@ -428,9 +713,8 @@ function Switch-Profile-Action {
     Write-Color "`n   [INFO] Switching to '$($Selected.alias)'..." -Color Cyan
     
     # 1. Change Global Config
-    git config --global user.name "$($Selected.userName)"
-    git config --global user.email "$($Selected.userEmail)"
-    
+    Set-Git-Identity -Name $Selected.userName -Email $Selected.userEmail
+
     # 2. Update Repo URL (Local Override)
     Update-Repo-Url -Alias $Selected.alias
 
@@ -451,16 +735,17 @@ function Remove-Profile-Action {
     Write-Host "`n"
     Draw-Header "REMOVE PROFILE"
     
-    # Hiển thị danh sách rõ ràng (Có cả Email)
+    # Hiển thị danh sách rõ ràng (Có cả Email) - gop N dong thanh 1 lan Write-Host
     $Format = "     [{0}] {1,-15} {2}"
     Write-Host ($Format -f "#", "ALIAS", "EMAIL") -ForegroundColor DarkGray
-    
-    for ($i = 0; $i -lt $Profiles.Count; $i++) {
-        Write-Host ($Format -f ($i+1), $Profiles[$i].alias, $Profiles[$i].userEmail) -ForegroundColor White
+
+    $Rows = for ($i = 0; $i -lt $Profiles.Count; $i++) {
+        $Format -f ($i + 1), $Profiles[$i].alias, $Profiles[$i].userEmail
     }
+    Write-Host ($Rows -join "`n") -ForegroundColor White
     Draw-Sep
 
-    $Choice = Read-Host "   Select ID to remove (0 to cancel)"
+    $Choice = Read-Input "   Select ID to remove (0 to cancel)"
     
     # Validate Input
     if ($Choice -eq "0" -or -not ($Choice -as [int])) { return }
@@ -470,13 +755,19 @@ function Remove-Profile-Action {
     $Removed = $Profiles[$Idx]
     
     Write-Color "`n   [WARNING] Deleting profile '$($Removed.alias)'..." "Red"
-    $Confirm = Read-Host "   Type 'DELETE' to confirm"
+    $Confirm = Read-Input "   Type 'DELETE' to confirm"
     if ($Confirm -ne "DELETE") { return }
 
     # 1. Remove SSH Keys
     if ($Removed.keyPath) {
-        if (Test-Path $Removed.keyPath) { Remove-Item $Removed.keyPath -Force; Write-Color "   [✔] Private Key deleted." "Gray" }
-        if (Test-Path "$($Removed.keyPath).pub") { Remove-Item "$($Removed.keyPath).pub" -Force; Write-Color "   [✔] Public Key deleted." "Gray" }
+        # Xoa dung 3 ten file da biet (private, .pub, -cert.pub) - KHONG glob 'keyPath*':
+        # prefix cua 'Work' se quet nham luon key cua 'Work2'
+        foreach ($KeyFile in @($Removed.keyPath, "$($Removed.keyPath).pub", "$($Removed.keyPath)-cert.pub")) {
+            if (Test-Path -LiteralPath $KeyFile) {
+                Remove-Item -LiteralPath $KeyFile -Force -ErrorAction SilentlyContinue
+                Write-Color "   [✔] Deleted: $(Split-Path $KeyFile -Leaf)" "Gray"
+            }
+        }
     }
 
     # 2. Remove from SSH Config
@@ -494,26 +785,43 @@ function Remove-Profile-Action {
     # 4. Check & Clear Global Config
     $Curr = Get-Git-Current
     if ($Curr.Name -eq $Removed.userName) {
-        git config --global --unset user.name
-        git config --global --unset user.email
+        # Cache config da co san map day du -> neu [user] chi chua name/email
+        # thi xoa ca section bang 1 process git thay vi 2 lan unset
+        $UserKeys = @()
+        if ($Curr.Map) { $UserKeys = @($Curr.Map.Keys | Where-Object { $_ -like 'user.*' }) }
+        $ExtraKeys = @($UserKeys | Where-Object { $_ -ne 'user.name' -and $_ -ne 'user.email' })
+        if ($UserKeys.Count -gt 0 -and $ExtraKeys.Count -eq 0) {
+            git config --global --remove-section user 2>$null
+        } else {
+            # Con key khac (vd: user.signingkey) -> chi unset dung 2 key cua minh
+            git config --global --unset user.name
+            git config --global --unset user.email
+        }
+        $script:GitConfigCache = $null
         Write-Color "   [INFO] Current Git config cleared because profile was removed." "Cyan"
     }
 
     Write-Color "   [✔] Profile removed successfully." "Green"
 }
 
+# Menu settings tinh -> ghep san nhu menu chinh (chunk1-4)
+$script:SettingsMenuText = @"
+     [1] Open profiles.json (View/Edit DB)
+     [2] Backup Profiles (Create snapshot)
+     [3] Open .ssh folder (View Keys)
+     [0] Back
+"@
+
 function Show-Settings-Action {
+    Initialize-System   # dung truc tiep $ProfilesFile/$SSHDir, khong qua Load-Profiles
     Write-Host "`n"
     Draw-Header "SETTINGS & TOOLS"
 
-    Write-Host "     [1] Open profiles.json (View/Edit DB)"
-    Write-Host "     [2] Backup Profiles (Create snapshot)"
-    Write-Host "     [3] Open .ssh folder (View Keys)"
-    Write-Host "     [0] Back"
-    
+    Write-Host $script:SettingsMenuText
+
     Draw-Sep
 
-    $Opt = Read-Host "   Choose"
+    $Opt = Read-Input "   Choose"
     switch ($Opt) {
         "1" { Invoke-Item $ProfilesFile }
         "2" { 
@@ -528,6 +836,8 @@ function Show-Settings-Action {
 
 # -------------------------- MAIN UI --------------------------
 
+$script:IsAdmin = $null   # lazy, tinh o lan ve banner dau tien
+
 function Show-Banner {
     $Art = @"
       ██████  ██ ████████     ███████ ██     ██ ██ ████████  ██████  ██   ██
@@ -543,9 +853,13 @@ function Show-Banner {
     Write-Host "   » GIT PROFILE MANAGEMENT SYSTEM [v2.1]" -ForegroundColor White
     Draw-Sep
     
-    $IsAdmin = ([Security.Principal.WindowsPrincipal][Security.Principal.WindowsIdentity]::GetCurrent()).IsInRole([Security.Principal.WindowsBuiltInRole]::Administrator)
-    
-    if ($IsAdmin) {
+    # Quyen admin khong doi trong ca session -> query WindowsPrincipal dung 1 lan,
+    # khong lap lai moi lan redraw banner
+    if ($null -eq $script:IsAdmin) {
+        $script:IsAdmin = ([Security.Principal.WindowsPrincipal][Security.Principal.WindowsIdentity]::GetCurrent()).IsInRole([Security.Principal.WindowsBuiltInRole]::Administrator)
+    }
+
+    if ($script:IsAdmin) {
         Write-Color "   [✔] STATUS: Running as Administrator" -Color Green
     } else {
         Write-Color "   [!] STATUS: Running as Standard User (Restrictions may apply)" -Color Yellow
@@ -557,36 +871,59 @@ function Show-Banner {
     Draw-Sep
 }
 
+# Menu tinh, khong doi trong runtime -> ghep san 1 chuoi, moi frame chi 1 lan Write-Host
+$script:MenuItemsText = @"
+
+     [1] Add New Profile
+     [2] Switch Profile
+     [3] Remove Profile
+     [4] Settings
+     [5] Test Connection
+     [0] Exit Program
+
+"@
+
 function Show-Menu {
     Write-Host ""
     Write-Host "   SELECT AN OPTION:" -ForegroundColor Gray
-    Write-Host ""
-    Write-Host "     [1] Add New Profile"
-    Write-Host "     [2] Switch Profile"
-    Write-Host "     [3] Remove Profile"
-    Write-Host "     [4] Settings"
-    Write-Host "     [5] Test Connection"
-    Write-Host "     [0] Exit Program"
-    Write-Host ""
+    Write-Host $script:MenuItemsText
     Draw-Sep
 }
 # ================= MAIN EXECUTION LOOP =================
-$Running = $true
-Initialize-System
 
+# Bang dispatch build 1 lan - moi keypress chi con 1 lan lookup hashtable.
+# Option "0" de ngoai bang vi scriptblock chay o child scope, khong set duoc $Running.
+$script:MenuActions = @{
+    "1" = { Add-Profile-Action; Pause }
+    "2" = { Switch-Profile-Action; Pause }
+    "3" = { Remove-Profile-Action; Pause }
+    "4" = { Show-Settings-Action; Pause }
+    "5" = { Test-Connection-Action; Pause }
+}
+
+$Running = $true
+$NeedRedraw = $true
+# Khong Initialize-System o day nua: moi action deu tu goi (qua Load-Profiles hoac truc tiep),
+# nen startup chi con ve banner - khong dung disk truoc khi nguoi dung chon gi
 do {
-    Clear-Host
-    Show-Banner
-    Show-Menu
-    $Selection = Read-Host "  Choose an option (0-5)"
-
-    switch ($Selection) {
-        "1" { Add-Profile-Action; Pause }
-        "2" { Switch-Profile-Action; Pause }
-        "3" { Remove-Profile-Action; Pause }
-        "4" { Show-Settings-Action; Pause }
-        "5" { Test-Connection-Action; Pause }  # <-- Mới thêm dòng này
-        "0" { $Running = $false; Write-Color "`n  Goodbye! 👋" "Magenta" }
-        default { Write-Color "  Invalid option." "Red"; Start-Sleep -Milliseconds 500 }
+    if ($NeedRedraw) {
+        Clear-Screen
+        Show-Banner
+        Show-Menu
+    }
+    $NeedRedraw = $true
+    $Selection = Read-Input "  Choose an option (0-5)"
+
+    if ($Selection -eq "0") {
+        $Running = $false
+        Write-Color "`n  Goodbye! 👋" "Magenta"
+    }
+    elseif ($script:MenuActions.ContainsKey($Selection)) {
+        & $script:MenuActions[$Selection]
+    }
+    else {
+        # Man hinh khong co gi moi -> khong clear + ve lai ca frame, chi bao loi roi hoi tiep
+        Write-Color "  Invalid option." "Red"
+        $NeedRedraw = $false
     }
 } while ($Running)
\ No newline at end of file